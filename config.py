@@ -14,4 +14,7 @@ DRIVE_FOLDER_NAME = "NOMINAS"  # Carpeta padre donde se creará la estructura /N
 
 # Configuración de archivos
 CREDENTIALS_FILE = "credentials.json"
-TOKEN_FILE = "token.pickle"
+TOKEN_FILE = "token.json"
+
+# Configuración de registro
+LOG_LEVEL = "INFO"  # Usa "DEBUG" para ver el detalle de cada archivo procesado
@@ -5,18 +5,71 @@ Fecha: 2025
 """
 
 import os
-import pickle
 import zipfile
 import io
 import base64
+import json
+import logging
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import httplib2
+import google_auth_httplib2
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload, set_user_agent
 import config
 
 
+logger = logging.getLogger(__name__)
+
+# Nombres de los meses en español, indexados por número de mes
+MONTH_NAMES = (
+    "", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO",
+    "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"
+)
+
+# Año al final del nombre de los archivos PDF (ej: "01 ENERO 2025.pdf")
+_PDF_YEAR_RE = re.compile(r'(\d{4})\.pdf$', re.IGNORECASE)
+
+
+class _SizedStream:
+    """
+    Envuelve un flujo de tamaño conocido para que MediaIoBaseUpload pueda medirlo
+    sin recorrerlo (en un archivo de un ZIP, buscar el final obliga a descomprimirlo)
+    """
+    
+    def __init__(self, stream, size):
+        self._stream = stream
+        self._size = size
+        self._at_end = False
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END and offset == 0:
+            self._at_end = True
+            return self._size
+        
+        self._at_end = False
+        return self._stream.seek(offset, whence)
+    
+    def tell(self):
+        return self._size if self._at_end else self._stream.tell()
+    
+    def read(self, size=-1):
+        return self._stream.read(size)
+    
+    def close(self):
+        self._stream.close()
+
+
 class GmailProcessor:
     """Clase para procesar correos de Gmail y subir archivos a Drive"""
     
@@ -26,7 +79,42 @@ class GmailProcessor:
         'https://www.googleapis.com/auth/drive.file'
     ]
     
-    def __init__(self, credentials_file='credentials.json', token_file='token.pickle'):
+    # Reintentos con espera exponencial ante errores de cuota (403/429) o del servidor (5xx)
+    API_NUM_RETRIES = 5
+    RETRYABLE_STATUS = (429, 500, 502, 503)
+    RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+    
+    # Número máximo de peticiones por lote admitido por la API de Gmail
+    GMAIL_BATCH_SIZE = 100
+    
+    # Número de subidas simultáneas a Drive
+    DRIVE_UPLOAD_WORKERS = 8
+    
+    # Tamaño de cada fragmento en las subidas reanudables a Drive (16 MB)
+    UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+    
+    # Por debajo de este tamaño (5 MB) se usa una única subida multipart
+    SIMPLE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+    
+    # Los ZIP mayores de este tamaño (50 MB) se guardan en un fichero temporal en disco
+    SPOOL_MAX_SIZE = 50 * 1024 * 1024
+    
+    # Caracteres base64 decodificados en cada paso (múltiplo de 4)
+    BASE64_CHUNK_SIZE = 4 * 1024 * 1024
+    
+    # Campos necesarios de cada mensaje (respuesta parcial para reducir el tamaño)
+    GMAIL_MESSAGE_FIELDS = (
+        'id,internalDate,payload/filename,payload/body,'
+        'payload/parts(filename,body/attachmentId,mimeType)'
+    )
+    
+    # El sufijo "(gzip)" indica a las APIs de Google que compriman las respuestas
+    USER_AGENT = 'gmail-processor (gzip)'
+    
+    # Tiempo máximo de espera de cada petición HTTP (segundos)
+    HTTP_TIMEOUT = 60
+    
+    def __init__(self, credentials_file='credentials.json', token_file='token.json'):
         """
         Inicializa el procesador de Gmail
         
@@ -38,15 +126,27 @@ class GmailProcessor:
         self.token_file = token_file
         self.gmail_service = None
         self.drive_service = None
+        self._creds = None
+        # Cada hilo usa su propio servicio de Drive (httplib2 no es thread-safe)
+        self._thread_local = threading.local()
+        self._folder_lock = threading.Lock()
+        # Caché de IDs de carpetas para evitar consultas repetidas a Drive
+        self._folder_cache = {}
+        self._parent_cache = {}
+        # Nombres de archivos ya presentes en cada carpeta de destino
+        self._existing_names = {}
         
     def authenticate(self):
         """Autentica y crea los servicios de Gmail y Drive"""
+        # Reutiliza los servicios si ya se crearon; AuthorizedHttp renueva el token cuando caduca
+        if self.gmail_service is not None and self.drive_service is not None:
+            return
+        
         creds = None
         
         # Carga el token existente si está disponible
         if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as token:
-                creds = pickle.load(token)
+            creds = Credentials.from_authorized_user_file(self.token_file, self.SCOPES)
         
         # Si no hay credenciales válidas disponibles, permite al usuario autenticarse
         if not creds or not creds.valid:
@@ -58,14 +158,46 @@ class GmailProcessor:
                 creds = flow.run_local_server(port=0)
             
             # Guarda las credenciales para la próxima ejecución
-            with open(self.token_file, 'wb') as token:
-                pickle.dump(creds, token)
+            with open(self.token_file, 'w') as token:
+                token.write(creds.to_json())
+        
+        # Construye los servicios compartiendo la misma conexión HTTP persistente
+        self._creds = creds
+        http = self._build_http()
+        self.gmail_service = build('gmail', 'v1', http=http)
+        self.drive_service = build('drive', 'v3', http=http)
+        self._thread_local.drive_service = self.drive_service
+        
+        logger.info("✅ Autenticación exitosa - Servicios Gmail y Drive inicializados")
+    
+    def _build_http(self):
+        """
+        Crea un cliente HTTP autorizado que solicita respuestas comprimidas con gzip
+        
+        Cada cliente mantiene sus conexiones abiertas, pero no es thread-safe:
+        debe crearse uno por hilo
+        
+        Returns:
+            AuthorizedHttp: Cliente HTTP autorizado con las credenciales actuales
+        """
+        http = google_auth_httplib2.AuthorizedHttp(
+            self._creds, http=httplib2.Http(cache=None, timeout=self.HTTP_TIMEOUT))
+        return set_user_agent(http, self.USER_AGENT)
+    
+    def _get_drive_service(self):
+        """
+        Obtiene el servicio de Drive asociado al hilo actual, creándolo si no existe
+        
+        Returns:
+            Resource: Servicio de Drive para el hilo actual
+        """
+        drive_service = getattr(self._thread_local, 'drive_service', None)
         
-        # Construye los servicios
-        self.gmail_service = build('gmail', 'v1', credentials=creds)
-        self.drive_service = build('drive', 'v3', credentials=creds)
+        if drive_service is None:
+            drive_service = build('drive', 'v3', http=self._build_http())
+            self._thread_local.drive_service = drive_service
         
-        print("✅ Autenticación exitosa - Servicios Gmail y Drive inicializados")
+        return drive_service
     
     def get_emails_from_sender(self, sender_email, days_back=12):
         """
@@ -83,24 +215,124 @@ class GmailProcessor:
             start_date = datetime.now() - timedelta(days=days_back)
             date_str = start_date.strftime('%Y/%m/%d')
             
-            # Construye la query de búsqueda
-            query = f'from:{sender_email} after:{date_str} has:attachment'
+            # Construye la query de búsqueda (solo correos con archivos ZIP adjuntos)
+            query = f'from:{sender_email} after:{date_str} filename:zip'
+            
+            logger.info("🔍 Buscando correos de %s desde %s", sender_email, date_str)
             
-            print(f"🔍 Buscando correos de {sender_email} desde {date_str}")
+            # Realiza la búsqueda recorriendo todas las páginas de resultados
+            messages = []
+            request = self.gmail_service.users().messages().list(
+                userId='me', q=query, maxResults=500,
+                fields='messages/id,nextPageToken')
             
-            # Realiza la búsqueda
-            result = self.gmail_service.users().messages().list(
-                userId='me', q=query).execute()
+            while request is not None:
+                result = request.execute(num_retries=self.API_NUM_RETRIES)
+                messages.extend(result.get('messages', []))
+                request = self.gmail_service.users().messages().list_next(request, result)
             
-            messages = result.get('messages', [])
-            print(f"📧 Encontrados {len(messages)} correos con archivos adjuntos")
+            logger.info("📧 Encontrados %s correos con archivos ZIP adjuntos", len(messages))
             
             return messages
             
         except Exception as error:
-            print(f"❌ Error al buscar correos: {error}")
+            logger.error("❌ Error al buscar correos: %s", error)
             return []
     
+    def fetch_messages_bulk(self, message_ids):
+        """
+        Obtiene los detalles de varios mensajes usando peticiones por lotes
+        
+        Args:
+            message_ids (list): Lista de IDs de mensajes
+            
+        Returns:
+            dict: Diccionario con el ID del mensaje y sus detalles
+        """
+        messages_detail = {}
+        retry_ids = []
+        
+        def _callback(request_id, response, exception):
+            if exception is None:
+                messages_detail[request_id] = response
+            elif isinstance(exception, HttpError) and self._is_retryable_error(exception):
+                retry_ids.append(request_id)
+            else:
+                logger.error("❌ Error al obtener el mensaje %s: %s", request_id, exception)
+        
+        pending_ids = list(message_ids)
+        
+        for attempt in range(self.API_NUM_RETRIES + 1):
+            # Espera exponencial con variación aleatoria antes de cada reintento
+            if attempt:
+                time.sleep(min(60, 2 ** attempt + random.random()))
+            
+            # Agrupa los IDs en lotes de GMAIL_BATCH_SIZE peticiones
+            for start in range(0, len(pending_ids), self.GMAIL_BATCH_SIZE):
+                batch_ids = pending_ids[start:start + self.GMAIL_BATCH_SIZE]
+                batch = self.gmail_service.new_batch_http_request(callback=_callback)
+                
+                for message_id in batch_ids:
+                    batch.add(
+                        self.gmail_service.users().messages().get(
+                            userId='me', id=message_id, format='full',
+                            fields=self.GMAIL_MESSAGE_FIELDS),
+                        request_id=message_id
+                    )
+                
+                try:
+                    batch.execute()
+                except HttpError as error:
+                    # Si falla el lote completo, vuelve a encolar los mensajes pendientes
+                    if self._is_retryable_error(error):
+                        retry_ids.extend(
+                            message_id for message_id in batch_ids
+                            if message_id not in messages_detail
+                        )
+                    else:
+                        logger.error("❌ Error al obtener un lote de %s mensajes: %s",
+                                     len(batch_ids), error)
+            
+            if not retry_ids:
+                break
+            
+            pending_ids = list(retry_ids)
+            retry_ids.clear()
+        else:
+            logger.error("❌ No se pudieron obtener %s mensajes tras %s reintentos",
+                         len(pending_ids), self.API_NUM_RETRIES)
+        
+        return messages_detail
+    
+    def _is_retryable_error(self, error):
+        """
+        Indica si un error de la API es temporal y merece reintentarse
+        
+        Los 403 solo se reintentan cuando se deben a límites de cuota, igual que
+        hace num_retries en el resto de llamadas
+        
+        Args:
+            error (HttpError): Error devuelto por la API
+            
+        Returns:
+            bool: True si el error es de cuota o del servidor
+        """
+        status = error.resp.status
+        
+        if status != 403:
+            return status in self.RETRYABLE_STATUS
+        
+        try:
+            error_info = json.loads(error.content.decode('utf-8'))['error']
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+        
+        if not isinstance(error_info, dict):
+            return False
+        
+        details = error_info.get('errors', []) + error_info.get('details', [])
+        return any(detail.get('reason') in self.RATE_LIMIT_REASONS for detail in details)
+    
     def download_attachment(self, message_id, attachment_id):
         """
         Descarga un archivo adjunto específico
@@ -110,55 +342,69 @@ class GmailProcessor:
             attachment_id (str): ID del archivo adjunto
             
         Returns:
-            bytes: Contenido del archivo adjunto
+            file: Fichero con el contenido del adjunto, en memoria o en disco según su tamaño
         """
         try:
+            # La API de Gmail solo devuelve los adjuntos codificados en base64 dentro del JSON
+            # (no admite descarga directa con get_media), así que se pide únicamente ese campo
             attachment = self.gmail_service.users().messages().attachments().get(
-                userId='me', messageId=message_id, id=attachment_id).execute()
+                userId='me', messageId=message_id, id=attachment_id, fields='data'
+            ).execute(num_retries=self.API_NUM_RETRIES)
+            
+            # Extrae la cadena base64 de la respuesta para liberarla en cuanto se decodifica
+            data = attachment.pop('data')
             
-            data = attachment['data']
-            file_data = base64.urlsafe_b64decode(data)
+            # Los adjuntos pequeños se quedan en memoria; los grandes se vuelcan a disco
+            if len(data) * 3 // 4 > self.SPOOL_MAX_SIZE:
+                file_data = tempfile.TemporaryFile()
+            else:
+                file_data = io.BytesIO()
+            
+            # Decodifica por fragmentos para no duplicar en memoria el adjunto completo
+            for start in range(0, len(data), self.BASE64_CHUNK_SIZE):
+                chunk = data[start:start + self.BASE64_CHUNK_SIZE]
+                file_data.write(base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4)))
             
+            file_data.seek(0)
             return file_data
             
         except Exception as error:
-            print(f"❌ Error al descargar archivo adjunto: {error}")
+            logger.error("❌ Error al descargar archivo adjunto: %s", error)
             return None
     
-    def extract_zip_content(self, zip_data, password=None):
+    def iter_zip_members(self, zip_data, password=None):
         """
-        Extrae el contenido de un archivo ZIP
+        Recorre los archivos de un ZIP sin descomprimirlos en memoria
         
         Args:
-            zip_data (bytes): Datos del archivo ZIP
+            zip_data (bytes | file): Datos del archivo ZIP o fichero que los contiene
             password (str): Contraseña del ZIP si está protegido
             
-        Returns:
-            dict: Diccionario con nombres de archivos y su contenido
+        Yields:
+            tuple: Nombre del archivo, objeto de fichero para leer su contenido y tamaño en bytes
         """
+        pwd = password.encode() if password else None
+        
         try:
-            extracted_files = {}
+            if isinstance(zip_data, bytes):
+                zip_data = io.BytesIO(zip_data)
             
-            with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_file:
-                # Si se proporciona contraseña, la configura
-                if password:
-                    zip_file.setpassword(password.encode())
-                
-                # Extrae todos los archivos
+            with zipfile.ZipFile(zip_data) as zip_file:
                 for file_info in zip_file.infolist():
-                    if not file_info.is_dir():
-                        try:
-                            file_content = zip_file.read(file_info.filename)
-                            extracted_files[file_info.filename] = file_content
-                            print(f"📄 Extraído: {file_info.filename}")
-                        except Exception as e:
-                            print(f"❌ Error al extraer {file_info.filename}: {e}")
-            
-            return extracted_files
+                    if file_info.is_dir():
+                        continue
+                    
+                    try:
+                        member = zip_file.open(file_info, pwd=pwd)
+                    except Exception as e:
+                        logger.error("❌ Error al extraer %s: %s", file_info.filename, e)
+                        continue
+                    
+                    logger.debug("📄 Extraído: %s", file_info.filename)
+                    yield file_info.filename, member, file_info.file_size
             
         except Exception as error:
-            print(f"❌ Error al extraer ZIP: {error}")
-            return {}
+            logger.error("❌ Error al extraer ZIP: %s", error)
     
     def upload_to_drive(self, file_name, file_content, folder_name="NOMINAS"):
         """
@@ -169,15 +415,36 @@ class GmailProcessor:
             file_content (bytes): Contenido del archivo
             folder_name (str): Nombre de la carpeta padre (default: "NOMINAS")
             
+        Returns:
+            str: ID del archivo subido o None si hubo error
+        """
+        return self.upload_stream_to_drive(
+            file_name, io.BytesIO(file_content), folder_name, len(file_content))
+    
+    def upload_stream_to_drive(self, file_name, file_obj, folder_name="NOMINAS", file_size=None):
+        """
+        Sube a Google Drive el contenido de un objeto de fichero
+        
+        Los archivos pequeños se suben en una única petición multipart y el resto
+        mediante subida reanudable por fragmentos
+        
+        Args:
+            file_name (str): Nombre del archivo
+            file_obj: Objeto de fichero con el contenido (se cierra al terminar)
+            folder_name (str): Nombre de la carpeta padre (default: "NOMINAS")
+            file_size (int): Tamaño del contenido en bytes (se calcula si no se indica)
+            
         Returns:
             str: ID del archivo subido o None si hubo error
         """
         try:
             # Obtiene el ID de la carpeta del año (crea estructura si no existe)
-            year = file_name[-8:-4] if file_name.lower().endswith('.pdf') else file_name[-4:]
-            target_folder_id = self.get_or_create_folder(folder_name, year)
+            year = self._get_year_from_filename(file_name)
+            # El bloqueo evita que varios hilos creen la misma carpeta a la vez
+            with self._folder_lock:
+                target_folder_id = self.get_or_create_folder(folder_name, year)
             if not target_folder_id:
-                print(f"❌ No se pudo configurar la carpeta de destino")
+                logger.error("❌ No se pudo configurar la carpeta de destino")
                 return None
             
             # Crea el archivo
@@ -186,27 +453,83 @@ class GmailProcessor:
                 'parents': [target_folder_id] if target_folder_id else []
             }
             
-            # Sube el archivo
+            if file_size is None:
+                file_size = file_obj.seek(0, io.SEEK_END)
+                file_obj.seek(0)
+            
+            # Los archivos pequeños se suben de una vez; los grandes, por fragmentos
+            resumable = file_size >= self.SIMPLE_UPLOAD_MAX_SIZE
+            
+            if resumable:
+                # Informa del tamaño sin recorrer el flujo para no descomprimirlo dos veces
+                source = _SizedStream(file_obj, file_size)
+            else:
+                # Los archivos pequeños se leen una sola vez en memoria
+                source = io.BytesIO(file_obj.read())
+            
             media = MediaIoBaseUpload(
-                io.BytesIO(file_content),
-                mimetype='application/octet-stream'
+                source,
+                mimetype='application/octet-stream',
+                chunksize=self.UPLOAD_CHUNK_SIZE if resumable else -1,
+                resumable=resumable
             )
             
-            file = self.drive_service.files().create(
+            request = self._get_drive_service().files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id'
-            ).execute()
+            )
+            
+            if resumable:
+                file = None
+                while file is None:
+                    _, file = request.next_chunk(num_retries=self.API_NUM_RETRIES)
+            else:
+                file = request.execute(num_retries=self.API_NUM_RETRIES)
             
             file_id = file.get('id')
-            print(f"✅ Archivo subido a Drive: {file_name} (ID: {file_id})")
+            logger.debug("✅ Archivo subido a Drive: %s (ID: %s)", file_name, file_id)
             
             return file_id
             
         except Exception as error:
-            print(f"❌ Error al subir archivo a Drive: {error}")
+            logger.error("❌ Error al subir archivo a Drive: %s", error)
             return None
+        
+        finally:
+            file_obj.close()
 
+    def _file_exists_in_drive(self, file_name, folder_name="NOMINAS"):
+        """
+        Comprueba si un archivo ya estaba en su carpeta de destino antes de esta ejecución
+        
+        Args:
+            file_name (str): Nombre del archivo
+            folder_name (str): Nombre de la carpeta padre (default: "NOMINAS")
+            
+        Returns:
+            bool: True si el archivo ya existe en Drive
+        """
+        year = self._get_year_from_filename(file_name)
+        
+        with self._folder_lock:
+            target_folder_id = self.get_or_create_folder(folder_name, year)
+        
+        return file_name in self._existing_names.get(target_folder_id, ())
+    
+    def _get_year_from_filename(self, file_name):
+        """
+        Obtiene el año de la carpeta de destino a partir del nombre del archivo
+        
+        Args:
+            file_name (str): Nombre del archivo (ej: "01 ENERO 2025.pdf")
+            
+        Returns:
+            str: Año del archivo
+        """
+        match = _PDF_YEAR_RE.search(file_name)
+        return match.group(1) if match else file_name[-4:]
+    
     def get_or_create_folder(self, folder_name, year):
         """
         Busca una carpeta en Drive por nombre o la crea si no existe
@@ -223,25 +546,33 @@ class GmailProcessor:
             # current_year = datetime.now().year
             year_folder_name = str(year)
             
-            print(f"🗂️  Configurando estructura: {folder_name}/{year_folder_name}/")
+            # Devuelve la carpeta desde la caché si ya se resolvió antes
+            cache_key = (folder_name, year_folder_name)
+            if cache_key in self._folder_cache:
+                return self._folder_cache[cache_key]
+            
+            logger.debug("🗂️  Configurando estructura: %s/%s/", folder_name, year_folder_name)
             
             # Paso 1: Buscar o crear la carpeta padre (NOMINAS)
             parent_folder_id = self._find_or_create_parent_folder(folder_name)
             
             if not parent_folder_id:
-                print(f"❌ No se pudo crear la carpeta padre: {folder_name}")
+                logger.error("❌ No se pudo crear la carpeta padre: %s", folder_name)
                 return None
             
             # Paso 2: Buscar o crear la carpeta del año dentro de la carpeta padre
             year_folder_id = self._find_or_create_year_folder(year_folder_name, parent_folder_id)
             
             if year_folder_id:
-                print(f"✅ Carpeta de destino lista: {folder_name}/{year_folder_name}/ (ID: {year_folder_id})")
+                self._folder_cache[cache_key] = year_folder_id
+                self._existing_names[year_folder_id] = self._list_file_names(year_folder_id)
+                logger.info("✅ Carpeta de destino lista: %s/%s/ (ID: %s)",
+                            folder_name, year_folder_name, year_folder_id)
             
             return year_folder_id
                 
         except Exception as error:
-            print(f"❌ Error al manejar estructura de carpetas: {error}")
+            logger.error("❌ Error al manejar estructura de carpetas: %s", error)
             return None
     
     def _find_or_create_parent_folder(self, folder_name):
@@ -254,13 +585,17 @@ class GmailProcessor:
         Returns:
             str: ID de la carpeta padre
         """
+        if folder_name in self._parent_cache:
+            return self._parent_cache[folder_name]
+        
         try:
             # Busca carpetas existentes por nombre en la raíz
-            results = self.drive_service.files().list(
+            results = self._get_drive_service().files().list(
                 q=f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
                 fields="files(id, name, parents)",
-                orderBy="createdTime desc"
-            ).execute()
+                orderBy="createdTime desc",
+                pageSize=10
+            ).execute(num_retries=self.API_NUM_RETRIES)
             
             folders = results.get('files', [])
             
@@ -270,11 +605,12 @@ class GmailProcessor:
                 selected_folder = root_folders[0] if root_folders else folders[0]
                 
                 folder_id = selected_folder['id']
-                print(f"📁 Usando carpeta padre existente: {folder_name} (ID: {folder_id})")
+                logger.debug("📁 Usando carpeta padre existente: %s (ID: %s)", folder_name, folder_id)
                 
                 if len(folders) > 1:
-                    print(f"ℹ️  Se encontraron {len(folders)} carpetas '{folder_name}', usando la de la raíz")
+                    logger.info("ℹ️  Se encontraron %s carpetas '%s', usando la de la raíz", len(folders), folder_name)
                 
+                self._parent_cache[folder_name] = folder_id
                 return folder_id
             else:
                 # Crea nueva carpeta padre en la raíz
@@ -283,18 +619,19 @@ class GmailProcessor:
                     'mimeType': 'application/vnd.google-apps.folder'
                 }
                 
-                folder = self.drive_service.files().create(
+                folder = self._get_drive_service().files().create(
                     body=folder_metadata,
                     fields='id'
-                ).execute()
+                ).execute(num_retries=self.API_NUM_RETRIES)
                 
                 folder_id = folder.get('id')
-                print(f"📁 Carpeta padre creada: {folder_name} (ID: {folder_id})")
+                logger.info("📁 Carpeta padre creada: %s (ID: %s)", folder_name, folder_id)
                 
+                self._parent_cache[folder_name] = folder_id
                 return folder_id
                 
         except Exception as error:
-            print(f"❌ Error al manejar carpeta padre: {error}")
+            logger.error("❌ Error al manejar carpeta padre: %s", error)
             return None
     
     def _find_or_create_year_folder(self, year_folder_name, parent_id):
@@ -310,17 +647,18 @@ class GmailProcessor:
         """
         try:
             # Busca la carpeta del año dentro de la carpeta padre
-            results = self.drive_service.files().list(
+            results = self._get_drive_service().files().list(
                 q=f"name='{year_folder_name}' and mimeType='application/vnd.google-apps.folder' and '{parent_id}' in parents and trashed=false",
                 fields="files(id, name)",
-                spaces='drive'
-            ).execute()
+                spaces='drive',
+                pageSize=10
+            ).execute(num_retries=self.API_NUM_RETRIES)
             
             folders = results.get('files', [])
             
             if folders:
                 year_folder_id = folders[0]['id']
-                print(f"📁 Usando carpeta de año existente: {year_folder_name} (ID: {year_folder_id})")
+                logger.debug("📁 Usando carpeta de año existente: %s (ID: %s)", year_folder_name, year_folder_id)
                 return year_folder_id
             else:
                 # Crea nueva carpeta del año dentro de la carpeta padre
@@ -330,20 +668,52 @@ class GmailProcessor:
                     'parents': [parent_id]
                 }
                 
-                folder = self.drive_service.files().create(
+                folder = self._get_drive_service().files().create(
                     body=folder_metadata,
                     fields='id'
-                ).execute()
+                ).execute(num_retries=self.API_NUM_RETRIES)
                 
                 year_folder_id = folder.get('id')
-                print(f"📁 Carpeta de año creada: {year_folder_name} (ID: {year_folder_id})")
+                logger.info("📁 Carpeta de año creada: %s (ID: %s)", year_folder_name, year_folder_id)
                 
                 return year_folder_id
                 
         except Exception as error:
-            print(f"❌ Error al manejar carpeta del año: {error}")
+            logger.error("❌ Error al manejar carpeta del año: %s", error)
             return None
     
+    def _list_file_names(self, folder_id):
+        """
+        Obtiene los nombres de los archivos que ya existen en una carpeta de Drive
+        
+        Args:
+            folder_id (str): ID de la carpeta
+            
+        Returns:
+            set: Conjunto con los nombres de los archivos de la carpeta
+        """
+        try:
+            names = set()
+            files_service = self._get_drive_service().files()
+            request = files_service.list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields='nextPageToken, files(name)',
+                pageSize=1000
+            )
+            
+            while request is not None:
+                results = request.execute(num_retries=self.API_NUM_RETRIES)
+                names.update(f['name'] for f in results.get('files', []))
+                request = files_service.list_next(request, results)
+            
+            logger.debug("📋 %s archivos existentes en la carpeta de destino", len(names))
+            
+            return names
+            
+        except Exception as error:
+            logger.error("❌ Error al listar archivos de la carpeta: %s", error)
+            return set()
+    
     def _get_email_date(self, msg_detail):
         """
         Obtiene la fecha de recepción del correo
@@ -361,12 +731,13 @@ class GmailProcessor:
             # Convierte de milisegundos a fecha
             email_date = datetime.fromtimestamp(internal_date / 1000)
             
-            print(f"📅 Fecha del correo: {email_date.strftime('%Y-%m-%d %H:%M:%S')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📅 Fecha del correo: %s", email_date.strftime('%Y-%m-%d %H:%M:%S'))
             
             return email_date
             
         except Exception as error:
-            print(f"❌ Error al obtener fecha del correo: {error}")
+            logger.error("❌ Error al obtener fecha del correo: %s", error)
             # Si hay error, usa la fecha actual como fallback
             return datetime.now()
 
@@ -382,13 +753,6 @@ class GmailProcessor:
             str: Nombre del archivo en formato "MM NOMBRE_MES"
         """
         try:
-            # Nombres de los meses en español
-            month_names = {
-                1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL",
-                5: "MAYO", 6: "JUNIO", 7: "JULIO", 8: "AGOSTO", 
-                9: "SEPTIEMBRE", 10: "OCTUBRE", 11: "NOVIEMBRE", 12: "DICIEMBRE"
-            }
-            
             # Calcula el mes anterior
             year = email_date.year - 1 if email_date.month == 1 else email_date.year
             current_day = email_date.day
@@ -396,7 +760,7 @@ class GmailProcessor:
             previous_month = current_month - 1 if current_month > 1 else 12
 
             # Obtiene el nombre del mes anterior
-            month_name = month_names[previous_month]
+            month_name = MONTH_NAMES[previous_month]
             
             # Obtiene la extensión del archivo original
             file_extension = ""
@@ -407,18 +771,20 @@ class GmailProcessor:
             if current_day < 14:
                 final_filename = f"{previous_month:02d} {month_name} {year}{file_extension}"
             else:
-                final_filename = f"{current_month:02d} extra {month_names[current_month]} {year}{file_extension}"
+                final_filename = f"{current_month:02d} extra {MONTH_NAMES[current_month]} {year}{file_extension}"
 
             # Cuando es el Certificado Ingresos y Retenciones
             if zipname[0] == 'Z':
                 final_filename = f"Certificado_Ingresos_y_Retenciones_ejercicio_{year-1}{file_extension}"
 
-            print(f"📝 Nombre del archivo: {final_filename} (mes anterior a {email_date.strftime('%B %Y')})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📝 Nombre del archivo: %s (mes anterior a %s)",
+                             final_filename, email_date.strftime('%B %Y'))
             
             return final_filename
             
         except Exception as error:
-            print(f"❌ Error al generar nombre del archivo: {error}")
+            logger.error("❌ Error al generar nombre del archivo: %s", error)
             # Si hay error, usa un nombre con timestamp como fallback
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             return f"{timestamp}_{original_filename}"
@@ -432,74 +798,101 @@ class GmailProcessor:
             zip_password (str): Contraseña de los archivos ZIP
         """
         try:
-            print(f"🚀 Iniciando procesamiento de correos de {sender_email}")
+            logger.info("🚀 Iniciando procesamiento de correos de %s", sender_email)
             
             # Autentica servicios
             self.authenticate()
             
+            # Vacía la caché de carpetas para no reutilizar IDs de una ejecución anterior
+            self._folder_cache.clear()
+            self._parent_cache.clear()
+            # Los archivos existentes en Drive se vuelven a listar en cada ejecución
+            self._existing_names.clear()
+            
             # Busca correos
             messages = self.get_emails_from_sender(sender_email, config.DAYS_TO_SEARCH)
             
             if not messages:
-                print("📭 No se encontraron correos para procesar")
+                logger.info("📭 No se encontraron correos para procesar")
                 return
             
             processed_count = 0
-            
-            for message in messages:
-                message_id = message['id']
-                
-                # Obtiene los detalles del mensaje
-                msg_detail = self.gmail_service.users().messages().get(
-                    userId='me', id=message_id).execute()
-                
-                # Busca archivos adjuntos ZIP
-                payload = msg_detail['payload']
-                parts = payload.get('parts', [])
-                
-                # Si no hay partes, el mensaje podría ser simple
-                if not parts:
-                    parts = [payload]
-                
-                for part in parts:
-                    if part.get('filename', '').lower().endswith('.zip'):
-                        attachment_id = part['body'].get('attachmentId')
+            skipped_count = 0
+            futures = []
+            
+            # Obtiene los detalles de todos los mensajes en lotes
+            messages_detail = self.fetch_messages_bulk([message['id'] for message in messages])
+            
+            # Las subidas a Drive se ejecutan en paralelo mientras se siguen procesando correos;
+            # los ZIP descargados se cierran al terminar las subidas, aunque se produzca un error
+            with ExitStack() as zip_files, \
+                    ThreadPoolExecutor(max_workers=self.DRIVE_UPLOAD_WORKERS) as executor:
+                for message_id, msg_detail in messages_detail.items():
+                    # Busca archivos adjuntos ZIP
+                    payload = msg_detail['payload']
+                    
+                    # Si no hay partes, el mensaje podría ser simple
+                    parts = payload.get('parts') or [payload]
+                    
+                    for part in parts:
+                        zipname = part.get('filename', '')
                         
-                        if attachment_id:
-                            zipname = part['filename']
-                            print(f"📎 Procesando archivo: {zipname}")
-                            
-                            # Descarga el ZIP
-                            zip_data = self.download_attachment(message_id, attachment_id)
+                        if zipname[-4:].lower() == '.zip':
+                            attachment_id = part.get('body', {}).get('attachmentId')
                             
-                            if zip_data:
-                                # Extrae el contenido
-                                extracted_files = self.extract_zip_content(zip_data, zip_password)
+                            if attachment_id:
+                                logger.info("📎 Procesando archivo: %s", zipname)
                                 
-                                # Sube cada archivo extraído a Drive
-                                for filename, content in extracted_files.items():
-                                    # Obtiene la fecha del correo para nombrar el archivo
+                                # Descarga el ZIP
+                                zip_data = self.download_attachment(message_id, attachment_id)
+                                
+                                if zip_data is not None:
+                                    zip_files.enter_context(zip_data)
+                                    
+                                    # Obtiene la fecha del correo para nombrar los archivos
                                     email_date = self._get_email_date(msg_detail)
+                                    extracted_count = 0
                                     
-                                    # Calcula el mes anterior y genera el nombre del archivo
-                                    file_name = self._generate_month_filename(email_date, filename, zipname)
+                                    # Sube cada archivo del ZIP a Drive sin descomprimirlo en memoria
+                                    for filename, member, size in self.iter_zip_members(zip_data, zip_password):
+                                        # Calcula el mes anterior y genera el nombre del archivo
+                                        file_name = self._generate_month_filename(email_date, filename, zipname)
+                                        extracted_count += 1
+                                        
+                                        # Omite los archivos que ya estaban en Drive antes de esta ejecución
+                                        if self._file_exists_in_drive(file_name, config.DRIVE_FOLDER_NAME):
+                                            logger.info("⏭️  El archivo ya existe en Drive, se omite: %s", file_name)
+                                            member.close()
+                                            skipped_count += 1
+                                            continue
+                                        
+                                        # Sube el archivo a la estructura NOMINAS/2025/
+                                        futures.append(executor.submit(
+                                            self.upload_stream_to_drive,
+                                            file_name,
+                                            member,
+                                            config.DRIVE_FOLDER_NAME,
+                                            size
+                                        ))
                                     
-                                    # Sube el archivo a la estructura NOMINAS/2025/
-                                    self.upload_to_drive(
-                                        file_name, 
-                                        content,
-                                        folder_name=config.DRIVE_FOLDER_NAME
-                                    )
-                                    processed_count += 1
+                                    logger.info("📄 Extraídos %s archivos de %s", extracted_count, zipname)
+                
+                # Espera a que terminen todas las subidas
+                for future in as_completed(futures):
+                    if future.result():
+                        processed_count += 1
             
-            print(f"✅ Procesamiento completado. {processed_count} archivos procesados.")
+            logger.info("✅ Procesamiento completado. %s archivos procesados, %s omitidos por existir ya en Drive.",
+                        processed_count, skipped_count)
             
         except Exception as error:
-            print(f"❌ Error durante el procesamiento: {error}")
+            logger.error("❌ Error durante el procesamiento: %s", error)
 
 
 if __name__ == "__main__":
     
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(message)s')
+    
     # Crea el procesador
     processor = GmailProcessor(
         credentials_file=config.CREDENTIALS_FILE,
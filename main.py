@@ -4,12 +4,15 @@ Script principal para ejecutar el procesador de nóminas
 
 import sys
 import os
+import logging
 from gmail_processor import GmailProcessor
 import config
 
 
 def main():
     """Función principal"""
+    logging.basicConfig(level=config.LOG_LEVEL, format='%(message)s')
+    
     try:
         print("=" * 50)
         print("🏢 PROCESADOR AUTOMÁTICO DE NÓMINAS")